@@ -0,0 +1,8 @@
+import os
+import sys
+
+# Skip writing .pyc / assertion-rewrite caches for this process and any
+# subprocesses; the heavy imports (dspy, mlflow, pydantic_monty) make the
+# cache churn noticeable on every run.
+sys.dont_write_bytecode = True
+os.environ.setdefault("PYTHONDONTWRITEBYTECODE", "1")
@@ -1,9 +1,21 @@
-from typing import Any
+import collections
+import functools
+import io
+import os
+import re
+from typing import Any, NamedTuple
 from collections.abc import Callable, Mapping
 
 import dspy
 import pydantic_monty
 from dspy import CodeInterpreterError
+from pydantic_monty import (
+    MontyComplete,
+    MontyRuntimeError,
+    MontySnapshot,
+    MontySyntaxError,
+    MontyTypingError,
+)
 from dspy.predict.rlm import FinalOutput, RLM, REPLHistory, translate_field_type
 
 
@@ -34,6 +46,234 @@ IMPORTANT: This is ITERATIVE. Each code block you write will execute, you'll see
 
 You have max {max_llm_calls} sub-LLM calls. When done, call SUBMIT() with your output."""
 
+_BUILTIN_TOOL_NAMES = ("SAVE", "CLEAR", "SUBMIT")
+
+# Dispatch-table entry for SUBMIT, matched by identity in the execute loop.
+_SUBMIT = object()
+
+_MARSHAL_MARKER = re.compile(r"^\s*###(\d+):", re.MULTILINE)
+
+# Prompts are only packed together while the chunk stays under this size;
+# sub-LLM prompts can be hundreds of thousands of characters each.
+_MARSHAL_MAX_CHARS = 20_000
+
+
+def _marshal_prompts(prompts: list[str], batch: int = 8) -> list[str]:
+    """Pack prompts into numbered multi-item prompts of at most `batch` items."""
+    marshaled = []
+    for start in range(0, len(prompts), batch):
+        chunk = prompts[start : start + batch]
+        items = "\n".join(f"###{i}: {p}" for i, p in enumerate(chunk, 1))
+        marshaled.append(
+            "Answer each item separately. Start each answer on a new line, "
+            f"prefixed by '###i:' where i is the item number.\n{items}"
+        )
+    return marshaled
+
+
+def _unmarshal_answers(response: str, n: int) -> list[str] | None:
+    """Split a marshaled response into `n` answers, or None if malformed."""
+    parts = _MARSHAL_MARKER.split(response)
+    indices = [int(i) for i in parts[1::2]]
+    # A repeated index is as malformed as a missing one.
+    if sorted(indices) != list(range(1, n + 1)):
+        return None
+    answers = dict(zip(indices, (a.strip() for a in parts[2::2])))
+    return [answers[i] for i in range(1, n + 1)]
+
+
+def _chunk_prompts(prompts: list[str], batch: int) -> list[list[str]]:
+    """Group prompts into chunks of at most `batch` items to pack together.
+
+    A chunk is closed early once it would exceed `_MARSHAL_MAX_CHARS`, so
+    large prompts are sent on their own.
+    """
+    chunks: list[list[str]] = []
+    chunk: list[str] = []
+    size = 0
+    for prompt in prompts:
+        if chunk and (len(chunk) >= batch or size + len(prompt) > _MARSHAL_MAX_CHARS):
+            chunks.append(chunk)
+            chunk, size = [], 0
+        chunk.append(prompt)
+        size += len(prompt)
+    if chunk:
+        chunks.append(chunk)
+    return chunks
+
+
+def _query_batched(
+    query_batched: Callable[[list[str]], list[str]],
+    prompts: list[str],
+    batch_size: int,
+) -> list[str]:
+    """Answer `prompts` in order, packing up to `batch_size` per request.
+
+    `query_batched` is RLM's own `llm_query_batched`, which charges every
+    request against `max_llm_calls` up front and sends them concurrently.
+    Chunks whose packed answer can't be split back into one answer per prompt
+    are re-sent one prompt per request, as a second batch.
+    """
+    chunks = _chunk_prompts(prompts, max(1, batch_size))
+    requests = [
+        chunk[0] if len(chunk) == 1 else _marshal_prompts(chunk, len(chunk))[0]
+        for chunk in chunks
+    ]
+    chunk_answers: list[list[str] | None] = []
+    for chunk, response in zip(chunks, query_batched(requests), strict=True):
+        if len(chunk) == 1:
+            chunk_answers.append([response])
+        elif response.startswith("[ERROR] "):
+            # The request itself failed; retrying each prompt would fail too.
+            chunk_answers.append([response] * len(chunk))
+        else:
+            chunk_answers.append(_unmarshal_answers(response, len(chunk)))
+
+    retry = [
+        prompt
+        for chunk, answers in zip(chunks, chunk_answers)
+        if answers is None
+        for prompt in chunk
+    ]
+    retried = iter(query_batched(retry) if retry else ())
+    results: list[str] = []
+    for chunk, answers in zip(chunks, chunk_answers):
+        if answers is None:
+            answers = [next(retried) for _ in chunk]
+        results.extend(answers)
+    return results
+
+
+@functools.lru_cache(maxsize=256)
+def _compile_monty(
+    code: str,
+    external_functions: tuple[str, ...],
+    inputs: tuple[str, ...],
+) -> pydantic_monty.Monty:
+    """Parse code into a `Monty` program, memoized across executions.
+
+    A `Monty` instance can be started any number of times with fresh input
+    values, so repeated snippets skip parsing entirely. Type-checking is opt-in
+    and memoized separately in `_type_check_monty`.
+    """
+    return pydantic_monty.Monty(
+        code,
+        inputs=list(inputs),
+        external_functions=list(external_functions),
+    )
+
+
+@functools.lru_cache(maxsize=256)
+def _type_check_monty(
+    code: str,
+    external_functions: tuple[str, ...],
+    inputs: tuple[str, ...],
+    stubs: str | None,
+) -> None:
+    """Type-check a compiled program, memoized so each snippet is checked once.
+
+    Failures raise and are therefore not cached. Bounded like `_compile_monty`.
+    """
+    _compile_monty(code, external_functions, inputs).type_check(stubs)
+
+
+# Appended to truncated stdout. Counted against max_output_chars so that RLM's
+# own truncation at the same limit never cuts it off. Sandbox code may catch
+# the overflow and keep going, so it only reports what happened to the output.
+_TRUNCATION_MARKER = "\n... (output truncated at {limit} chars)\n"
+
+_OVERFLOW_MESSAGE = "stdout limit reached"
+
+
+class _OutputOverflow(Exception):
+    """Raised into the sandbox to abort a run whose stdout exceeded its cap."""
+
+
+class _BoundedOutput:
+    """Captured sandbox stdout, capped at `limit` characters including the marker.
+
+    The print that crosses the cap is written up to the cap and then raises
+    `_OutputOverflow`, so the run stops early instead of producing output
+    that would be discarded. Limits shorter than the marker cut the marker.
+    """
+
+    __slots__ = ("_buf", "_limit", "_marker", "overflowed")
+
+    def __init__(self, limit: int | None) -> None:
+        self._buf = io.StringIO()
+        if limit is None:
+            self._marker = ""
+            self._limit = None
+        else:
+            self._marker = _TRUNCATION_MARKER.format(limit=limit)[: max(0, limit)]
+            self._limit = limit - len(self._marker)
+        self.overflowed = False
+
+    def capture(self, _stream: str, text: str) -> None:
+        if self._limit is not None:
+            room = max(0, self._limit - self._buf.tell())
+            if len(text) > room:
+                self._buf.write(text[:room])
+                self.overflowed = True
+                raise _OutputOverflow(_OVERFLOW_MESSAGE)
+        self._buf.write(text)
+
+    def is_overflow_error(self, error: Exception) -> bool:
+        """Whether `error` is the sandbox surfacing our own overflow."""
+        return self.overflowed and _OVERFLOW_MESSAGE in str(error)
+
+    def getvalue(self) -> str:
+        value = self._buf.getvalue()
+        return value + self._marker if self.overflowed else value
+
+
+class _ExecutionContext(NamedTuple):
+    """Per-`execute` state shared by the progress handlers."""
+
+    dispatch: Mapping[str, Any]
+    output_field_names: tuple[str, ...]
+    stdout: _BoundedOutput
+
+
+def _handle_complete(
+    progress: MontyComplete, ctx: _ExecutionContext
+) -> tuple[bool, Any]:
+    return True, ctx.stdout.getvalue() or None
+
+
+def _handle_snapshot(
+    progress: MontySnapshot, ctx: _ExecutionContext
+) -> tuple[bool, Any]:
+    func = ctx.dispatch.get(progress.function_name)
+    if func is _SUBMIT:
+        submit_kwargs = dict(progress.kwargs)
+        for name, value in zip(ctx.output_field_names, progress.args, strict=False):
+            submit_kwargs.setdefault(name, value)
+        return True, FinalOutput(submit_kwargs)
+    if func is None:
+        raise CodeInterpreterError(f"Unknown function: {progress.function_name}")
+    try:
+        result = func(*progress.args, **progress.kwargs)
+        return False, progress.resume(return_value=result)
+    except Exception as e:
+        raise CodeInterpreterError(
+            f"Tool {progress.function_name} failed: {e}"
+        ) from e
+
+
+def _handle_unknown(progress: Any, ctx: _ExecutionContext) -> tuple[bool, Any]:
+    raise CodeInterpreterError("Async futures not supported")
+
+
+# Keyed on exact type (Monty's progress classes are final), so each hop of the
+# execute loop is one dict lookup instead of a chain of isinstance checks.
+# Handlers return (done, value): the next progress object, or the final result.
+_ProgressHandler = Callable[[Any, _ExecutionContext], tuple[bool, Any]]
+_PROGRESS_HANDLERS: dict[type, _ProgressHandler] = {
+    MontyComplete: _handle_complete,
+    MontySnapshot: _handle_snapshot,
+}
+
 
 class MontyCodeInterpreter(dspy.CodeInterpreter):
     """A code interpreter that uses Monty to execute code."""
@@ -45,6 +285,7 @@ class MontyCodeInterpreter(dspy.CodeInterpreter):
         type_check: bool = True,
         type_check_stubs: str | None = None,
         limits: pydantic_monty.ResourceLimits | None = None,
+        max_output_chars: int | None = None,
     ) -> None:
         """Initialize code interpreter backed by Monty.
 
@@ -56,11 +297,15 @@ class MontyCodeInterpreter(dspy.CodeInterpreter):
             type_check_stubs: Optional code to prepend before type-checking
                 to serve as stubs.
             limits: Optional resource limits for code execution.
+            max_output_chars: Optional cap on captured stdout. The print that
+                crosses it aborts the run, and the output captured so far is
+                returned with a truncation marker, all within this many chars.
         """
         self._tools = dict(tools) if tools else {}
         self._type_check = type_check
         self._type_check_stubs = type_check_stubs
         self._limits = limits
+        self._max_output_chars = max_output_chars
         self._state: dict[str, Any] = {}
         self.output_fields: list[dict[str, Any]] | None = None
 
@@ -68,19 +313,62 @@ class MontyCodeInterpreter(dspy.CodeInterpreter):
     def tools(self) -> dict[str, Callable[..., str]]:
         return self._tools
 
+    @property
+    def output_fields(self) -> list[dict[str, Any]] | None:
+        return self._output_fields
+
+    @output_fields.setter
+    def output_fields(self, value: list[dict[str, Any]] | None) -> None:
+        self._output_fields = value
+        self._output_field_names = tuple(f["name"] for f in value or ())
+
     def start(self) -> None:
         self._state.clear()
 
     def shutdown(self) -> None:
         pass
 
+    def _construct_monty(
+        self, code: str, input_names: tuple[str, ...]
+    ) -> pydantic_monty.Monty:
+        """Compile code (type-checking it once if enabled), mapping Monty errors."""
+        try:
+            external_names = tuple(
+                name for name in self._tools if name not in _BUILTIN_TOOL_NAMES
+            ) + _BUILTIN_TOOL_NAMES
+            monty = _compile_monty(code, external_names, input_names)
+            if self._type_check:
+                _type_check_monty(
+                    code, external_names, input_names, self._type_check_stubs
+                )
+        except MontySyntaxError as e:
+            raise SyntaxError(str(e)) from e
+        except MontyTypingError as e:
+            raise CodeInterpreterError(str(e)) from e
+        return monty
+
+    def _start_monty(
+        self,
+        monty: pydantic_monty.Monty,
+        inputs: Mapping[str, Any],
+        print_callback: Callable[[str, str], None],
+    ) -> Any:
+        """Start a compiled program, mapping runtime errors."""
+        try:
+            return monty.start(
+                inputs=inputs or None,
+                limits=self._limits,
+                print_callback=print_callback,
+            )
+        except MontyRuntimeError as e:
+            raise CodeInterpreterError(str(e)) from e
+
     def execute(
         self,
         code: str,
         variables: dict[str, Any] | None = None,
     ) -> Any:
         """Execute the code and return the output."""
-        all_tools = dict(self._tools)
 
         def _save(**kwargs: Any) -> str:
             self._state.update(kwargs)
@@ -94,68 +382,39 @@ class MontyCodeInterpreter(dspy.CodeInterpreter):
                 self._state.pop(n, None)
             return f"Cleared: {', '.join(names)}"
 
-        all_tools["SAVE"] = _save
-        all_tools["CLEAR"] = _clear
-        all_tools["SUBMIT"] = lambda **kwargs: None
-
-        merged_vars: dict[str, Any] = {}
-        if variables:
-            merged_vars.update(variables)
-        merged_vars.update(self._state)
-
-        try:
-            monty = pydantic_monty.Monty(
-                code,
-                inputs=list(merged_vars) if merged_vars else [],
-                external_functions=list(all_tools),
-                type_check=self._type_check,
-                type_check_stubs=self._type_check_stubs,
-            )
-        except pydantic_monty.MontySyntaxError as e:
-            raise SyntaxError(str(e)) from e
-        except pydantic_monty.MontyTypingError as e:
-            raise CodeInterpreterError(str(e)) from e
-
-        stdout_parts: list[str] = []
-
-        def _capture_print(_stream: str, text: str) -> None:
-            stdout_parts.append(text)
-
+        builtins_map: dict[str, Any] = {
+            "SAVE": _save,
+            "CLEAR": _clear,
+            "SUBMIT": _SUBMIT,
+        }
+        # Layer built-ins over user tools instead of copying the tools dict.
+        dispatch = collections.ChainMap(builtins_map, self._tools)
+
+        # Saved state wins over per-call variables; only copy when both exist.
+        if not self._state:
+            merged_vars = variables or {}
+        elif not variables:
+            merged_vars = self._state
+        else:
+            merged_vars = {**variables, **self._state}
+
+        monty = self._construct_monty(code, tuple(merged_vars))
+
+        stdout = _BoundedOutput(self._max_output_chars)
         try:
-            progress = monty.start(
-                inputs=merged_vars or None,
-                limits=self._limits,
-                print_callback=_capture_print,
-            )
-        except pydantic_monty.MontyRuntimeError as e:
-            raise CodeInterpreterError(str(e)) from e
-
-        while not isinstance(progress, pydantic_monty.MontyComplete):
-            if isinstance(progress, pydantic_monty.MontySnapshot):
-                if progress.function_name == "SUBMIT":
-                    submit_kwargs = dict(progress.kwargs)
-                    if progress.args and self.output_fields:
-                        field_names = [f["name"] for f in self.output_fields]
-                        for name, value in zip(field_names, progress.args):
-                            submit_kwargs.setdefault(name, value)
-                    return FinalOutput(submit_kwargs)
-
-                func = all_tools.get(progress.function_name)
-                if func is None:
-                    raise CodeInterpreterError(
-                        f"Unknown function: {progress.function_name}"
-                    )
-                try:
-                    result = func(*progress.args, **progress.kwargs)
-                    progress = progress.resume(return_value=result)
-                except Exception as e:
-                    raise CodeInterpreterError(
-                        f"Tool {progress.function_name} failed: {e}"
-                    ) from e
-            else:
-                raise CodeInterpreterError("Async futures not supported")
-
-        return "".join(stdout_parts) if stdout_parts else None
+            progress = self._start_monty(monty, merged_vars, stdout.capture)
+            ctx = _ExecutionContext(dispatch, self._output_field_names, stdout)
+            while True:
+                handler = _PROGRESS_HANDLERS.get(type(progress), _handle_unknown)
+                done, progress = handler(progress, ctx)
+                if done:
+                    return progress
+        except CodeInterpreterError as e:
+            # The overflow surfaces as a sandbox error; report what was captured.
+            # Anything else, even after an overflow, is a real failure.
+            if stdout.is_overflow_error(e):
+                return stdout.getvalue()
+            raise
 
 
 class MontyRLM(RLM):
@@ -167,6 +426,12 @@ class MontyRLM(RLM):
     - SAVE()/CLEAR() allow persisting state across iterations
 
     If no interpreter is provided, a MontyCodeInterpreter is created automatically.
+    `llm_query_batched` packs `marshal_batch_size` prompts per request
+    (env `MONTY_BATCH_SIZE`, default 4) and keeps at most
+    `max_concurrent_batches` requests in flight (env `MONTY_MAX_CONC`, default 32).
+    Each packed request counts as one call against `max_llm_calls`. Both knobs
+    are read at the start of every run, so they can be changed after
+    construction and apply to any interpreter.
     """
 
     def __init__(
@@ -181,11 +446,26 @@ class MontyRLM(RLM):
         interpreter: MontyCodeInterpreter | None = None,
         type_check: bool = False,
         limits: pydantic_monty.ResourceLimits | None = None,
+        marshal_batch_size: int | None = None,
+        max_concurrent_batches: int | None = None,
     ):
+        if marshal_batch_size is None:
+            marshal_batch_size = int(os.getenv("MONTY_BATCH_SIZE", "4"))
+        if max_concurrent_batches is None:
+            max_concurrent_batches = int(os.getenv("MONTY_MAX_CONC", "32"))
+        if marshal_batch_size < 1:
+            raise ValueError(
+                f"marshal_batch_size must be >= 1, got {marshal_batch_size}"
+            )
+        if max_concurrent_batches < 1:
+            raise ValueError(
+                f"max_concurrent_batches must be >= 1, got {max_concurrent_batches}"
+            )
         if interpreter is None:
             interpreter = MontyCodeInterpreter(
                 type_check=type_check,
                 limits=limits,
+                max_output_chars=max_output_chars,
             )
         super().__init__(
             signature,
@@ -197,6 +477,24 @@ class MontyRLM(RLM):
             sub_lm=sub_lm,
             interpreter=interpreter,
         )
+        self.marshal_batch_size = marshal_batch_size
+        self.max_concurrent_batches = max_concurrent_batches
+
+    def _make_llm_tools(self, max_workers: int | None = None) -> dict[str, Callable]:
+        """Create RLM's LLM tools, packing prompts in `llm_query_batched`."""
+        if max_workers is None:
+            max_workers = self.max_concurrent_batches
+        tools = super()._make_llm_tools(max_workers)
+        query_batched = tools["llm_query_batched"]
+
+        def llm_query_batched(prompts: list[str]) -> list[str]:
+            """Query the LLM with multiple prompts concurrently."""
+            if not prompts:
+                return []
+            return _query_batched(query_batched, prompts, self.marshal_batch_size)
+
+        tools["llm_query_batched"] = llm_query_batched
+        return tools
 
     def _build_signatures(self) -> tuple[dspy.Signature, dspy.Signature]:
         """Build signatures using Monty-specific action instructions."""
@@ -0,0 +1,62 @@
+"""Optional compiled build of ``monty_rlm``.
+
+Dev installs stay pure-Python. Set ``MONTY_COMPILED=1`` to compile
+``monty_rlm.py`` into a C extension with Cython (``pip install cython``)::
+
+    MONTY_COMPILED=1 python setup.py build_ext --inplace
+
+The resulting ``monty_rlm.*.so`` sits next to ``monty_rlm.py`` and takes
+precedence on import; delete it to go back to the pure-Python module.
+
+To ship precompiled bytecode instead, run ``python setup.py build_pyc``.
+"""
+
+import compileall
+import os
+import py_compile
+
+from setuptools import Command, setup
+
+PY_SOURCES = ["monty_rlm.py", "utils"]
+
+
+class build_pyc(Command):
+    """Precompile sources to ``__pycache__`` with hash-checked .pyc files."""
+
+    description = "precompile bytecode with checked-hash invalidation"
+    user_options = []
+
+    def initialize_options(self) -> None:
+        pass
+
+    def finalize_options(self) -> None:
+        pass
+
+    def run(self) -> None:
+        # Not optimize=2: dspy reads signature docstrings as instructions.
+        mode = py_compile.PycInvalidationMode.CHECKED_HASH
+        for source in PY_SOURCES:
+            if os.path.isdir(source):
+                ok = compileall.compile_dir(source, quiet=1, invalidation_mode=mode)
+            else:
+                ok = compileall.compile_file(source, quiet=1, invalidation_mode=mode)
+            if not ok:
+                raise SystemExit(f"failed to compile {source}")
+
+
+ext_modules = []
+if os.getenv("MONTY_COMPILED") == "1":
+    from Cython.Build import cythonize
+
+    ext_modules = cythonize(
+        ["monty_rlm.py"],
+        # Annotations are documentation here; letting Cython enforce them turns
+        # `dict[...]` hints into exact-type checks that reject dict subclasses.
+        compiler_directives={"language_level": "3", "annotation_typing": False},
+    )
+
+setup(
+    py_modules=["monty_rlm"],
+    ext_modules=ext_modules,
+    cmdclass={"build_pyc": build_pyc},
+)
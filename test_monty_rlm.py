@@ -1,10 +1,28 @@
+import os
+import threading
+import time
+
 import dspy
+import monty_rlm
 import pytest
-from monty_rlm import MontyCodeInterpreter, MontyRLM
+from dspy import CodeInterpreterError
+from monty_rlm import (
+    _TRUNCATION_MARKER,
+    MontyCodeInterpreter,
+    MontyRLM,
+    _compile_monty,
+)
 from utils.openrouter_utils import get_openrouter_lm
 from utils.tooling_utils import web_search
 
 
+def test_compiled_module_is_loaded_when_requested():
+    """`MONTY_COMPILED=1 pytest` must exercise the Cython extension."""
+    if os.getenv("MONTY_COMPILED") != "1":
+        pytest.skip("pure-Python run")
+    assert not monty_rlm.__file__.endswith(".py")
+
+
 @pytest.fixture
 def interp():
     return MontyCodeInterpreter(type_check=False)
@@ -18,6 +36,47 @@ def test_execute_with_variables(interp):
     assert interp.execute("print(x * y)", variables={"x": 3, "y": 4}) == "12\n"
 
 
+def test_execute_reuses_compiled_code(interp):
+    """Re-running the same snippet hits the compile cache with fresh inputs."""
+    assert interp.execute("print(x)", variables={"x": 1}) == "1\n"
+    hits = _compile_monty.cache_info().hits
+    assert interp.execute("print(x)", variables={"x": 2}) == "2\n"
+    assert _compile_monty.cache_info().hits == hits + 1
+
+
+def test_execute_aborts_past_max_output_chars():
+    """Printing past max_output_chars stops the run and marks the truncation."""
+    calls = []
+    limit = 46  # leaves 10 characters of output next to the marker
+    marker = _TRUNCATION_MARKER.format(limit=limit)
+    interp = MontyCodeInterpreter(
+        tools={"tick": lambda: calls.append(1)},
+        type_check=False,
+        max_output_chars=limit,
+    )
+    code = "for i in range(100):\n    print('abcd')\n    tick()"
+    assert interp.execute(code) == "abcd\nabcd\n" + marker
+    assert len(calls) == 2
+    assert interp.execute("print('x' * 100)") == "x" * 10 + marker
+
+
+def test_execute_output_fits_limits_shorter_than_marker():
+    interp = MontyCodeInterpreter(type_check=False, max_output_chars=5)
+    assert len(interp.execute("print('x' * 100)")) == 5
+
+
+def test_execute_overflow_does_not_hide_later_errors():
+    def boom():
+        raise ValueError("boom")
+
+    interp = MontyCodeInterpreter(
+        tools={"boom": boom}, type_check=False, max_output_chars=5
+    )
+    code = "try:\n    print('abcd' * 10)\nexcept Exception:\n    pass\nboom()"
+    with pytest.raises(CodeInterpreterError, match="boom"):
+        interp.execute(code)
+
+
 def test_execute_with_tool():
     def greet(name: str) -> str:
         return f"hello {name}"
@@ -33,6 +92,148 @@ def test_tools_injected_after_init():
     assert interp.execute("print(double(5))") == "10\n"
 
 
+def test_tools_added_after_first_execute():
+    interp = MontyCodeInterpreter(type_check=False)
+    assert interp.execute("print(1)") == "1\n"
+    interp.tools["double"] = lambda x: x * 2
+    assert interp.execute("print(double(5))") == "10\n"
+
+
+def _llm_query_batched(sub_lm, **kwargs):
+    rlm = MontyRLM("question -> answer: str", sub_lm=sub_lm, **kwargs)
+    return rlm._make_llm_tools()["llm_query_batched"]
+
+
+def test_llm_query_batched_answers_in_order():
+    seen = []
+
+    def sub_lm(prompt: str) -> list[str]:
+        seen.append(prompt)
+        return [prompt.upper()]
+
+    batched = _llm_query_batched(sub_lm, marshal_batch_size=1)
+    assert batched(["a", "b", "c"]) == ["A", "B", "C"]
+    assert sorted(seen) == ["a", "b", "c"]
+
+
+def test_llm_query_batched_charges_all_prompts_up_front():
+    """An over-budget batch fails before any request is sent."""
+    calls = []
+    batched = _llm_query_batched(
+        lambda p: calls.append(p) or [p], max_llm_calls=2, marshal_batch_size=1
+    )
+    with pytest.raises(RuntimeError, match="LLM call limit exceeded"):
+        batched(["a", "b", "c"])
+    assert calls == []
+
+
+def test_llm_query_batched_reports_failed_prompts():
+    def sub_lm(prompt: str) -> list[str]:
+        if prompt == "b":
+            raise ValueError("boom")
+        return [prompt]
+
+    batched = _llm_query_batched(sub_lm, marshal_batch_size=1)
+    assert batched(["a", "b"]) == ["a", "[ERROR] boom"]
+
+
+def test_llm_query_batched_marshals_prompts():
+    """Prompts are packed into one sub-LM call per marshal_batch_size chunk."""
+    calls = []
+
+    def sub_lm(prompt: str) -> list[str]:
+        calls.append(prompt)
+        if "###" not in prompt:  # a lone prompt is sent as-is
+            return [prompt.upper()]
+        items = [line.split(": ", 1) for line in prompt.splitlines()[1:]]
+        return ["\n".join(f"{marker}: {text.upper()}" for marker, text in items)]
+
+    batched = _llm_query_batched(sub_lm, marshal_batch_size=2)
+    assert batched(["a", "b", "c"]) == ["A", "B", "C"]
+    assert len(calls) == 2
+
+
+def test_llm_query_batched_reads_knobs_at_call_time():
+    """Batch knobs apply to user-supplied interpreters and later changes."""
+    calls = []
+
+    def sub_lm(prompt: str) -> list[str]:
+        calls.append(prompt)
+        return [prompt]
+
+    rlm = MontyRLM(
+        "question -> answer: str",
+        sub_lm=sub_lm,
+        interpreter=MontyCodeInterpreter(type_check=False),
+        marshal_batch_size=4,
+    )
+    rlm.marshal_batch_size = 1
+    batched = rlm._make_llm_tools()["llm_query_batched"]
+    assert batched(["a", "b"]) == ["a", "b"]
+    assert sorted(calls) == ["a", "b"]
+
+
+def test_rlm_rejects_non_positive_batch_knobs(monkeypatch):
+    with pytest.raises(ValueError, match="max_concurrent_batches"):
+        MontyRLM("question -> answer: str", max_concurrent_batches=0)
+    monkeypatch.setenv("MONTY_BATCH_SIZE", "0")
+    with pytest.raises(ValueError, match="marshal_batch_size"):
+        MontyRLM("question -> answer: str")
+
+
+def test_llm_query_batched_unmarshal_falls_back_per_prompt():
+    """A response that can't be split is retried one prompt at a time."""
+
+    def sub_lm(prompt: str) -> list[str]:
+        return ["garbled" if "###" in prompt else prompt.upper()]
+
+    batched = _llm_query_batched(sub_lm, marshal_batch_size=4)
+    assert batched(["a", "b"]) == ["A", "B"]
+
+
+def test_llm_query_batched_charges_fallback_requests():
+    """Per-prompt retries of an unsplittable chunk count against the budget."""
+    calls = []
+
+    def sub_lm(prompt: str) -> list[str]:
+        calls.append(prompt)
+        return ["garbled"]
+
+    batched = _llm_query_batched(sub_lm, max_llm_calls=4, marshal_batch_size=4)
+    with pytest.raises(RuntimeError, match="LLM call limit exceeded"):
+        batched(["a", "b", "c", "d"])
+    assert len(calls) == 1
+
+
+def test_llm_query_batched_rejects_duplicate_answer_index():
+    def sub_lm(prompt: str) -> list[str]:
+        return ["###1: X\n###1: Y" if "###" in prompt else prompt.upper()]
+
+    batched = _llm_query_batched(sub_lm, marshal_batch_size=2)
+    assert batched(["a", "b"]) == ["A", "B"]
+
+
+def test_llm_query_batched_respects_max_concurrent_batches():
+    lock = threading.Lock()
+    in_flight = [0]
+    peak = [0]
+
+    def sub_lm(prompt: str) -> list[str]:
+        with lock:
+            in_flight[0] += 1
+            peak[0] = max(peak[0], in_flight[0])
+        time.sleep(0.01)
+        with lock:
+            in_flight[0] -= 1
+        return [prompt]
+
+    batched = _llm_query_batched(
+        sub_lm, marshal_batch_size=1, max_concurrent_batches=2
+    )
+    assert batched(["a", "b", "c", "d", "e"]) == ["a", "b", "c", "d", "e"]
+    assert peak[0] <= 2
+
+
 def test_save_persists_across_calls(interp):
     """SAVE() persists variables across execute() calls."""
     interp.execute("SAVE(x=42)")
@@ -48,6 +249,12 @@ def test_clear_removes_saved_state(interp):
         interp.execute("print(x)")
 
 
+def test_submit_maps_positional_args_to_output_fields(interp):
+    interp.output_fields = [{"name": "answer"}, {"name": "score"}]
+    result = interp.execute("SUBMIT('yes', score=3)")
+    assert result.output == {"answer": "yes", "score": 3}
+
+
 def test_rlm_simple():
     """MontyRLM answers a simple question."""
     lm = dspy.LM("openai/gpt-4.1-nano")
@@ -1,3 +1,4 @@
+import functools
 import os
 
 import dspy
@@ -6,7 +7,10 @@ from dotenv import load_dotenv
 load_dotenv()
 
 
+@functools.lru_cache(maxsize=8)
 def get_openrouter_lm(model):
+    # Cached per model so repeated callers share one LM. Without an explicit
+    # client, litellm reuses a single pooled HTTP handler across LMs.
     lm = dspy.LM(
         model=model,
         api_base=os.getenv("OPEN_ROUTER_BASE_URL"),